@@ -9,6 +9,12 @@ from datetime import datetime
 import requests
 import socket
 import json
+import uuid
+from module.character_maker import create_character, load_character, list_characters, CharacterValidator
+from module.metrics import start_metrics_server, METRICS_PORT, METRICS_HOST
+from module.tts_router import TTSRouter, DEFAULT_TIMEOUT as TTS_TIMEOUT
+from module.speculative_tts import SpeculativeReplyPipeline
+from module.client_packager import ChunkStore, collect_client_sources, build_client_bundle, write_pack, build_delta_pack, format_size
 def get_system_info():
     """获取系统配置信息"""
     try:
@@ -273,6 +279,66 @@ def update_performance_and_recommendations():
     
     return system_display, cpu_display, memory_display, gpu_display, server_display, recommendations_display
 
+def get_installed_model_names():
+    """获取已经安装的Live2D模型名称"""
+    try:
+        with open('userData/installedModel.json', 'r', encoding='utf-8') as f:
+            return list(json.load(f).keys())
+    except Exception:
+        return []
+
+def get_voice_model_config():
+    """获取GPT-Sovits语音模型配置"""
+    try:
+        with open('module/gpt_sovits_model_config.json', 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def save_character(name, model_name, voice_name, persona, sample_text):
+    """保存人物"""
+    try:
+        if not name or not model_name or not voice_name:
+            return "## 保存失败\n请填写人物名称并选择Live2D模型和语音"
+        with open('userData/installedModel.json', 'r', encoding='utf-8') as f:
+            live2d_model_path = json.load(f)[model_name]
+        create_character(name, live2d_model_path, get_voice_model_config()[voice_name], persona, sample_text)
+        return f"## 已保存人物 {name}"
+    except Exception as e:
+        return f"## 保存失败\n{str(e)}"
+
+def validate_all_characters():
+    """并行验证所有人物"""
+    try:
+        manifests = [load_character(name) for name in list_characters()]
+        if not manifests:
+            return "## 暂无人物"
+        results = CharacterValidator(tts_router.synthesize).validate_all(manifests)
+        return "\n".join(format_info_display(result["检查项"], f"{name} {'✅' if result['通过'] else '❌'}") for name, result in results.items())
+    except Exception as e:
+        return f"## 验证失败\n{str(e)}"
+
+def package_client(model_name, version, voice_dir, base_version):
+    """打包客户端，填写基础版本时同时生成增量包"""
+    try:
+        if not model_name or not version:
+            return "## 打包失败\n请选择模型并填写版本号"
+        name = model_name
+        store = ChunkStore()
+        sources = collect_client_sources(model_name, voice_dir or None, bundle_root=store.root)
+        manifest, stats = build_client_bundle(name, version, sources, store)
+
+        full_pack = os.path.join(store.root, 'packs', f"{name}-{version}.zip")
+        write_pack(store, manifest, full_pack)
+        stats["总大小"] = format_size(stats["总大小"])
+        stats["完整包"] = f"{full_pack} ({format_size(os.path.getsize(full_pack))})"
+        if base_version:
+            delta_pack, chunk_count = build_delta_pack(store, name, base_version, version)
+            stats["增量包"] = f"{delta_pack} ({format_size(os.path.getsize(delta_pack))}, {chunk_count} 个文件块)"
+        return format_info_display(stats, "打包完成")
+    except Exception as e:
+        return f"## 打包失败\n{str(e)}"
+
 class Config:
     def __init__(self):
         self.Live2D_model_name = ""
@@ -287,6 +353,18 @@ class Config:
         self.remote_model_api_key = ""
         self.is_model_support_multimodal = False
         self.enable_gpt_sovits = False
+        self.enable_speculative_reply = False # 提前播放首个分句
+        self.speculative_min_clause_chars = 6 # 首个分句的最少字数
+        self.speculative_flush_chars = 0 # 后续分批合成的最少字数，0表示等LLM输出完毕后一次合成
+        self.text_split_method = "cut5"
+        self.tts_endpoints = ["http://127.0.0.1:9880"] # GPT-Sovits实例地址
+        self.tts_min_local_workers = 0 # 本地GPT-Sovits进程数下限
+        self.tts_max_local_workers = 0 # 本地GPT-Sovits进程数上限
+        self.tts_timeout = TTS_TIMEOUT # 单次合成的超时（秒）
+        self.gpt_sovits_dir = "" # GPT-Sovits目录，本地进程在该目录下启动
+        self.tts_local_command = [] # 本地GPT-Sovits进程启动命令，{port}会被替换为端口号，为空时使用 python api_v2.py
+        self.metrics_port = METRICS_PORT # Prometheus /metrics 端口
+        self.metrics_host = METRICS_HOST # Prometheus /metrics 监听地址，默认只允许本机访问
 
         self.can_gpt_sovits_enable = False
         self.can_multimodal_enable = False
@@ -304,19 +382,113 @@ class Config:
             self.can_multimodal_enable = False
 
     def read_config_from_file(self, string):
-        with open(string, "r") as f:
+        with open(string, "r", encoding="utf-8") as f:
             config = json.load(f)
         return config
     
+    def load_config_from_file(self, string):
+        """读取配置文件并更新到当前对象，文件不存在时保持默认值"""
+        if not os.path.exists(string):
+            return
+        for key, value in self.read_config_from_file(string).items():
+            if hasattr(self, key):
+                setattr(self, key, value)
+
     def write_config_to_file(self, string):
-        with open(string, "w") as f:
-            json.dump(self, f)
+        config = {key: value for key, value in vars(self).items() if not key.startswith("can_")}
+        with open(string, "w", encoding="utf-8") as f:
+            json.dump(config, f, ensure_ascii=False, indent=4)
 
 class gpt_sovits_handler:
     def __init__(self):
         self.enable = False
     
-    
+CONFIG_FILE = "userData/config.json"
+config = Config()
+config.load_config_from_file(CONFIG_FILE)
+
+def build_tts_router(config):
+    """根据配置创建TTS路由器"""
+    return TTSRouter(
+        config.tts_endpoints,
+        local_command=config.tts_local_command or None,
+        local_cwd=config.gpt_sovits_dir or None,
+        min_local_workers=config.tts_min_local_workers,
+        max_local_workers=config.tts_max_local_workers,
+        timeout=config.tts_timeout,
+    )
+
+# 所有TTS请求都通过路由器发送
+tts_router = build_tts_router(config)
+
+def get_tts_status():
+    """获取GPT-Sovits实例状态"""
+    return format_info_display(tts_router.status(), "GPT-Sovits实例状态")
+
+def save_tts_router_config(endpoints, gpt_sovits_dir, min_local_workers, max_local_workers):
+    """保存GPT-Sovits实例配置并重新创建路由器"""
+    global tts_router
+    try:
+        config.tts_endpoints = [line.strip() for line in endpoints.splitlines() if line.strip()]
+        config.gpt_sovits_dir = gpt_sovits_dir.strip()
+        config.tts_min_local_workers = int(min_local_workers)
+        config.tts_max_local_workers = int(max_local_workers)
+        config.write_config_to_file(CONFIG_FILE)
+
+        tts_router.stop()
+        tts_router = build_tts_router(config).start()
+        return get_tts_status()
+    except Exception as e:
+        return f"## 保存失败\n{str(e)}"
+
+def save_speech_config(enable_gpt_sovits, text_split_method, enable_speculative_reply, min_clause_chars, flush_chars):
+    """保存语音合成设置"""
+    try:
+        config.enable_gpt_sovits = bool(enable_gpt_sovits)
+        config.text_split_method = text_split_method
+        config.enable_speculative_reply = bool(enable_speculative_reply)
+        config.speculative_min_clause_chars = int(min_clause_chars)
+        config.speculative_flush_chars = int(flush_chars)
+        config.write_config_to_file(CONFIG_FILE)
+        return "## 已保存语音合成设置"
+    except Exception as e:
+        return f"## 保存失败\n{str(e)}"
+
+def create_speech_pipeline(model_config):
+    """根据配置创建语音合成流水线，未开启提前回复时整段合成"""
+    return SpeculativeReplyPipeline(
+        model_config,
+        enable=config.enable_speculative_reply,
+        min_clause_chars=config.speculative_min_clause_chars,
+        flush_chars=config.speculative_flush_chars,
+        text_split_method=config.text_split_method,
+        synthesize_fn=tts_router.synthesize,
+    )
+
+def speak_reply(prompt, voice_name):
+    """用Gemini生成回复并合成语音，每合成一段就更新一次，第一段合成后立即播放"""
+    try:
+        if not prompt or not voice_name:
+            yield None, "## 合成失败\n请输入对话内容并选择语音"
+            return
+        # Gemini模块导入时会连接API，只在需要时导入
+        from module.gemini_function import gemini_speak
+
+        # 每个请求使用单独的目录，多个会话同时合成时不会覆盖彼此的语音
+        output_dir = os.path.join("userData/output", f"reply_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}")
+        os.makedirs(output_dir, exist_ok=True)
+        pipeline = create_speech_pipeline(get_voice_model_config()[voice_name])
+        start_time = time.time()
+        segments = {}
+        for index, (text, audio) in enumerate(gemini_speak(prompt, pipeline, config.remote_model_name or "gemini-2.0-flash")):
+            audio_path = os.path.join(output_dir, f"{index}.wav")
+            with open(audio_path, "wb") as f:
+                f.write(audio)
+            segments[f"第{index + 1}段 ({time.time() - start_time:.2f} s)"] = text
+            # 只在第一段时更新语音组件，之后的更新不打断正在播放的语音
+            yield audio_path if index == 0 else gr.update(), format_info_display(segments, "回复")
+    except Exception as e:
+        yield gr.update(), f"## 合成失败\n{str(e)}"
         
 with gr.Blocks() as mainUI:
     gr.Markdown("DesktopGirl服务端")
@@ -350,10 +522,66 @@ with gr.Blocks() as mainUI:
                 gr.Button("确认")
             gr.Button("请帮助我配置模型", variant="primary")
         with gr.Tab("GPT-Sovits模型配置"):
-            gr.Checkbox(label="是否开启GPT-Sovits", value=False, interactive=True)
+            enable_gpt_sovits = gr.Checkbox(label="是否开启GPT-Sovits", value=config.enable_gpt_sovits, interactive=True)
+            with gr.Row():
+                text_split_method = gr.Dropdown(label="文本切分方式", choices=["cut0","cut1","cut2","cut3","cut4","cut5"], value=config.text_split_method, interactive=True)
+                enable_speculative_reply = gr.Checkbox(label="提前回复（LLM输出第一个分句时立即合成播放）", value=config.enable_speculative_reply, interactive=True)
+            with gr.Row():
+                speculative_min_clause_chars = gr.Slider(label="首个分句最少字数（越小出声越早，TTS调用越多）", minimum=2, maximum=30, step=1, value=config.speculative_min_clause_chars, interactive=True)
+                speculative_flush_chars = gr.Slider(label="后续分批合成字数（0表示一次合成）", minimum=0, maximum=100, step=5, value=config.speculative_flush_chars, interactive=True)
+            save_speech_config_btn = gr.Button("保存合成设置", variant="primary")
+            speech_config_output = gr.Markdown("")
+            save_speech_config_btn.click(
+                fn=save_speech_config,
+                inputs=[enable_gpt_sovits, text_split_method, enable_speculative_reply, speculative_min_clause_chars, speculative_flush_chars],
+                outputs=[speech_config_output]
+            )
+            with gr.Row():
+                speak_prompt = gr.Textbox(label="对话测试", value="", interactive=True)
+                speak_voice = gr.Dropdown(label="选择语音", choices=list(get_voice_model_config().keys()), interactive=True)
+            speak_btn = gr.Button("生成回复并合成")
+            with gr.Row():
+                speak_audio = gr.Audio(label="第一段语音", type="filepath", autoplay=True)
+                speak_output = gr.Markdown("")
+            speak_btn.click(fn=speak_reply, inputs=[speak_prompt, speak_voice], outputs=[speak_audio, speak_output])
+            with gr.Row():
+                tts_endpoints = gr.Textbox(label="GPT-Sovits实例地址（每行一个）", value="\n".join(config.tts_endpoints), lines=3, interactive=True)
+                with gr.Column():
+                    gpt_sovits_dir = gr.Textbox(label="GPT-Sovits目录（用于启动本地进程）", value=config.gpt_sovits_dir, interactive=True)
+                    tts_min_local_workers = gr.Slider(label="本地进程数下限", minimum=0, maximum=8, step=1, value=config.tts_min_local_workers, interactive=True)
+                    tts_max_local_workers = gr.Slider(label="本地进程数上限", minimum=0, maximum=8, step=1, value=config.tts_max_local_workers, interactive=True)
+            with gr.Row():
+                save_tts_router_btn = gr.Button("保存实例配置", variant="primary")
+                refresh_tts_status_btn = gr.Button("🔄 刷新实例状态")
+            tts_status_output = gr.Markdown("")
+            save_tts_router_btn.click(
+                fn=save_tts_router_config,
+                inputs=[tts_endpoints, gpt_sovits_dir, tts_min_local_workers, tts_max_local_workers],
+                outputs=[tts_status_output]
+            )
+            refresh_tts_status_btn.click(fn=get_tts_status, outputs=[tts_status_output])
 
         with gr.Tab("人物制作器"):
-            pass
+            gr.Markdown("### 将Live2D模型、语音和人设打包为一个人物")
+            with gr.Row():
+                character_name = gr.Textbox(label="人物名称", value="", interactive=True)
+                character_model = gr.Dropdown(label="选择Live2D模型", choices=get_installed_model_names(), interactive=True)
+                character_voice = gr.Dropdown(label="选择语音", choices=list(get_voice_model_config().keys()), interactive=True)
+            character_persona = gr.Textbox(label="人设提示词", value="", lines=8, interactive=True)
+            character_sample_text = gr.Textbox(label="试合成文本", value="你好，很高兴见到你。", interactive=True)
+            with gr.Row():
+                save_character_btn = gr.Button("保存人物", variant="primary")
+                validate_characters_btn = gr.Button("验证所有人物")
+            character_output = gr.Markdown("")
+            save_character_btn.click(
+                fn=save_character,
+                inputs=[character_name, character_model, character_voice, character_persona, character_sample_text],
+                outputs=[character_output]
+            )
+            validate_characters_btn.click(
+                fn=validate_all_characters,
+                outputs=[character_output]
+            )
         with gr.Tab("性能监测器"):
             gr.Markdown("### 电脑配置与服务端性能监测")
             
@@ -389,11 +617,26 @@ with gr.Blocks() as mainUI:
             )
         
         with gr.Tab("客户端独立打包"):
-            pass
+            gr.Markdown("### 打包Live2D模型、预渲染语音和配置，相同的文件内容只保存一份")
+            with gr.Row():
+                bundle_model_name = gr.Dropdown(label="选择Live2D模型", choices=get_installed_model_names(), interactive=True)
+                bundle_version = gr.Textbox(label="版本号", value="1.0.0", interactive=True)
+            with gr.Row():
+                bundle_voice_dir = gr.Textbox(label="预渲染语音目录（可选）", value="", interactive=True)
+                bundle_base_version = gr.Textbox(label="客户端当前版本（填写后生成增量包）", value="", interactive=True)
+            bundle_btn = gr.Button("开始打包", variant="primary")
+            bundle_output = gr.Markdown("")
+            bundle_btn.click(
+                fn=package_client,
+                inputs=[bundle_model_name, bundle_version, bundle_voice_dir, bundle_base_version],
+                outputs=[bundle_output]
+            )
         with gr.Tab("关于"):
             pass
 
 if __name__ == "__main__":
     os.environ["HTTP_PROXY"] = "http://127.0.0.1:7890"
     os.environ["HTTPS_PROXY"] = "http://127.0.0.1:7890"
+    start_metrics_server(config.metrics_port, config.metrics_host)
+    tts_router.start()
     mainUI.launch()
@@ -0,0 +1,230 @@
+import os
+import re
+import json
+import wave
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from module.tts_router import TTSRouter
+from module.metrics import CACHE_REQUESTS
+
+CACHE_HITS = CACHE_REQUESTS.labels("character_validation", "hit")
+CACHE_MISSES = CACHE_REQUESTS.labels("character_validation", "miss")
+
+# 人物清单保存目录，目录下只保存人物清单
+CHARACTER_DIR = 'userData/characters'
+VALIDATION_CACHE_FILE = 'userData/character_validation_cache.json'
+
+# 人设提示词的token上限，过长会挤占对话上下文
+MAX_PERSONA_TOKENS = 2000
+
+# GPT-SoVITS 要求参考音频在3~10秒之间
+REF_AUDIO_MIN_SECONDS = 3
+REF_AUDIO_MAX_SECONDS = 10
+
+DEFAULT_SAMPLE_TEXT = "你好，很高兴见到你。"
+
+def estimate_tokens(text):
+    """
+    粗略估计token数：每个中日韩字符算1个token，其余文本按4个字符1个token计算
+    :param text: 文本
+    :return: 估计的token数
+    """
+    cjk_count = len(re.findall(r'[぀-ヿ㐀-䶿一-鿿가-힯]', text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+def check_character_name(name):
+    """人物名称用作文件名，不能包含路径分隔符或指向其他目录"""
+    if not name or not name.strip():
+        raise ValueError("人物名称不能为空")
+    if name != name.strip() or name.startswith('.') or name.endswith('.') or any(char in name for char in '/\\:*?"<>|\0'):
+        raise ValueError(f"人物名称 '{name}' 不能以空格或 . 开头结尾，也不能包含 / \\ : * ? \" < > |")
+
+def character_path(name, character_dir=CHARACTER_DIR):
+    check_character_name(name)
+    return os.path.join(character_dir, f"{name}.json")
+
+def create_character(name, live2d_model_path, voice_config, persona, sample_text=DEFAULT_SAMPLE_TEXT, character_dir=CHARACTER_DIR):
+    """
+    保存人物清单，将Live2D模型、语音和人设打包在一起
+    :param name: 人物名称
+    :param live2d_model_path: Live2D模型文件夹
+    :param voice_config: 语音模型配置（gpt_sovits_model_config.json 中的一项）
+    :param persona: 人设提示词
+    :param sample_text: 验证时用于试合成的文本
+    :return: 人物清单
+    """
+    manifest = {
+        "name": name,
+        "live2d-model-path": live2d_model_path,
+        "voice": voice_config,
+        "persona": persona,
+        "sample-text": sample_text,
+    }
+    os.makedirs(character_dir, exist_ok=True)
+    with open(character_path(name, character_dir), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=4)
+    return manifest
+
+def load_character(name, character_dir=CHARACTER_DIR):
+    with open(character_path(name, character_dir), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def list_characters(character_dir=CHARACTER_DIR):
+    """获取所有人物名称"""
+    if not os.path.isdir(character_dir):
+        return []
+    return sorted(os.path.splitext(item)[0] for item in os.listdir(character_dir) if item.endswith('.json'))
+
+def file_signature(path):
+    """文件或文件夹的修改时间和大小，用于判断是否需要重新验证"""
+    if not path or not os.path.exists(path):
+        return None
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        return [stat.st_mtime_ns, stat.st_size]
+    signature = []
+    for root, _, files in os.walk(path):
+        for file in sorted(files):
+            stat = os.stat(os.path.join(root, file))
+            signature.append([os.path.relpath(os.path.join(root, file), path), stat.st_mtime_ns, stat.st_size])
+    return sorted(signature)
+
+def character_fingerprint(manifest):
+    """人物清单及其引用文件的指纹"""
+    voice = manifest.get("voice", {})
+    data = {
+        "manifest": manifest,
+        "live2d": file_signature(manifest.get("live2d-model-path")),
+        "gpt": file_signature(voice.get("weight-path")),
+        "sovits": file_signature(voice.get("sovits-path")),
+        "ref-audio": file_signature(voice.get("ref-audio-path")),
+    }
+    return hashlib.sha256(json.dumps(data, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+def check_persona(manifest):
+    """检查人设提示词长度"""
+    persona = manifest.get("persona", "")
+    tokens = estimate_tokens(persona)
+    if not persona.strip():
+        return False, "人设提示词为空"
+    if tokens > MAX_PERSONA_TOKENS:
+        return False, f"人设提示词约 {tokens} tokens，超过上限 {MAX_PERSONA_TOKENS}"
+    return True, f"约 {tokens} tokens"
+
+def check_live2d_model(manifest):
+    """检查Live2D模型文件夹中是否有 .model3.json"""
+    model_path = manifest.get("live2d-model-path", "")
+    if not os.path.isdir(model_path):
+        return False, f"Live2D模型文件夹 '{model_path}' 不存在"
+    for _, _, files in os.walk(model_path):
+        if any(file.endswith('.model3.json') for file in files):
+            return True, "正常"
+    return False, "Live2D模型文件夹中没有 .model3.json 文件"
+
+def check_reference_audio(manifest):
+    """检查语音模型权重和参考音频"""
+    voice = manifest.get("voice", {})
+    for key in ("weight-path", "sovits-path", "ref-audio-path"):
+        if not os.path.isfile(voice.get(key, "")):
+            return False, f"{key} '{voice.get(key, '')}' 不存在"
+    if not voice.get("prompt-text"):
+        return False, "参考音频缺少对应文本 prompt-text"
+
+    ref_audio_path = voice["ref-audio-path"]
+    if ref_audio_path.lower().endswith('.wav'):
+        try:
+            with wave.open(ref_audio_path, 'rb') as f:
+                duration = f.getnframes() / f.getframerate()
+        except (wave.Error, EOFError) as e:
+            return False, f"参考音频无法读取: {e}"
+        if not REF_AUDIO_MIN_SECONDS <= duration <= REF_AUDIO_MAX_SECONDS:
+            return False, f"参考音频时长 {duration:.1f} 秒，需要在 {REF_AUDIO_MIN_SECONDS}~{REF_AUDIO_MAX_SECONDS} 秒之间"
+        return True, f"参考音频时长 {duration:.1f} 秒"
+    if os.path.getsize(ref_audio_path) == 0:
+        return False, "参考音频为空文件"
+    # 非wav格式不检查时长
+    return True, "正常"
+
+class CharacterValidator:
+    """
+    批量并行验证人物，试合成通过信号量限制并发数，避免压垮TTS服务
+    验证结果按人物指纹缓存，人物未修改时直接返回缓存结果
+
+    试合成必须先加载人物自己的GPT和SoVITS权重，否则只能验证到后端当前加载的语音，
+    因此 synthesize_fn 需要是会切换权重的 TTSRouter.synthesize，默认连接本地GPT-SoVITS。
+    路由器对每个实例的切换权重和合成是串行的，多个试合成不会在同一个实例上互相覆盖语音。
+    """
+    def __init__(self, synthesize_fn=None, max_workers=8, max_synthesis=2, cache_file=VALIDATION_CACHE_FILE):
+        self.synthesize_fn = synthesize_fn or TTSRouter().synthesize
+        self.max_workers = max_workers
+        self.synthesis_semaphore = threading.Semaphore(max_synthesis)
+        self.cache_file = cache_file
+        self.cache_lock = threading.Lock()
+        self.cache = {}
+        if os.path.exists(cache_file):
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                self.cache = json.load(f)
+
+    def save_cache(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_file)), exist_ok=True)
+        with self.cache_lock:
+            with open(self.cache_file, 'w', encoding='utf-8') as f:
+                json.dump(self.cache, f, ensure_ascii=False, indent=4)
+
+    def check_sample_synthesis(self, manifest):
+        """用人物语音试合成一段文本"""
+        with self.synthesis_semaphore:
+            try:
+                audio = self.synthesize_fn(manifest.get("sample-text") or DEFAULT_SAMPLE_TEXT, manifest["voice"])
+            except Exception as e:
+                return False, f"试合成失败: {e}"
+        if not audio:
+            return False, "试合成返回空音频"
+        return True, f"试合成 {len(audio)} 字节"
+
+    def validate(self, manifest):
+        """
+        验证单个人物
+        :param manifest: 人物清单
+        :return: 验证结果
+        """
+        fingerprint = character_fingerprint(manifest)
+        with self.cache_lock:
+            cached = self.cache.get(manifest["name"])
+        if cached and cached["fingerprint"] == fingerprint:
+            CACHE_HITS.inc()
+            return cached["result"]
+        CACHE_MISSES.inc()
+
+        checks = {
+            "人设": check_persona(manifest),
+            "Live2D模型": check_live2d_model(manifest),
+            "参考音频": check_reference_audio(manifest),
+        }
+        # 前面的检查都通过才试合成
+        if all(passed for passed, _ in checks.values()):
+            checks["试合成"] = self.check_sample_synthesis(manifest)
+        result = {
+            "通过": all(passed for passed, _ in checks.values()),
+            "检查项": {key: ("✅ " if passed else "❌ ") + message for key, (passed, message) in checks.items()},
+        }
+        # 试合成失败可能是TTS服务暂时不可用，不缓存
+        if checks.get("试合成", (True, ""))[0]:
+            with self.cache_lock:
+                self.cache[manifest["name"]] = {"fingerprint": fingerprint, "result": result}
+        return result
+
+    def validate_all(self, manifests):
+        """
+        并行验证多个人物
+        :param manifests: 人物清单列表
+        :return: 人物名称 -> 验证结果
+        """
+        # 相同语音的人物排在一起，减少后端切换权重的次数
+        manifests = sorted(manifests, key=lambda m: (m.get("voice", {}).get("weight-path", ""), m.get("voice", {}).get("sovits-path", "")))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = dict(zip([m["name"] for m in manifests], executor.map(self.validate, manifests)))
+        self.save_cache()
+        return results
@@ -0,0 +1,342 @@
+import os
+import json
+import hashlib
+import zipfile
+
+from module.metrics import CACHE_REQUESTS
+
+INDEX_HITS = CACHE_REQUESTS.labels("bundle_index", "hit")
+INDEX_MISSES = CACHE_REQUESTS.labels("bundle_index", "miss")
+
+# 打包输出目录
+BUNDLE_ROOT = 'userData/bundle'
+
+# 按内容切块（FastCDC）的最小、平均、最大块大小，相同内容的块只保存一份
+# 块边界由内容决定，文件中间插入或删除数据时只有附近的块会改变
+MIN_CHUNK_SIZE = 8 * 1024
+AVG_CHUNK_SIZE = 32 * 1024
+MAX_CHUNK_SIZE = 128 * 1024
+
+# 每次从文件读取的大小
+READ_SIZE = 4 * 1024 * 1024
+
+# gear哈希表，由固定种子生成，保证每次运行切出的块相同
+GEAR = [int.from_bytes(hashlib.sha256(b"gear" + bytes([i])).digest()[:8], 'little') for i in range(256)]
+HASH_MASK = (1 << 64) - 1
+
+def boundary_mask(bits):
+    """取哈希的高位判断边界，高位受最近64个字节影响"""
+    return ((1 << bits) - 1) << (64 - bits)
+
+def find_chunk_end(data, start, min_size, avg_size, max_size):
+    """
+    FastCDC：在 data[start:] 中查找下一个块边界
+    未到平均大小时使用较严格的掩码，超过后使用较宽松的掩码，使块大小集中在平均值附近
+    :return: 块结束位置
+    """
+    end = min(len(data), start + max_size)
+    if end - start <= min_size:
+        return end
+    bits = avg_size.bit_length() - 1
+    strict_mask = boundary_mask(bits + 2)
+    loose_mask = boundary_mask(bits - 2)
+    normal_end = min(end, start + avg_size)
+    gear = GEAR
+    h = 0
+    i = start + min_size
+    while i < normal_end:
+        h = ((h << 1) + gear[data[i]]) & HASH_MASK
+        i += 1
+        if not h & strict_mask:
+            return i
+    while i < end:
+        h = ((h << 1) + gear[data[i]]) & HASH_MASK
+        i += 1
+        if not h & loose_mask:
+            return i
+    return end
+
+def iter_chunks(f, min_size=MIN_CHUNK_SIZE, avg_size=AVG_CHUNK_SIZE, max_size=MAX_CHUNK_SIZE):
+    """
+    按内容切块
+    :param f: 以二进制方式打开的文件
+    :return: 生成器，依次产出文件块数据
+    """
+    buffer = b""
+    eof = False
+    while True:
+        # 缓冲区中至少保留一个最大块，块边界才不受读取位置影响
+        if not eof and len(buffer) < max_size:
+            data = f.read(READ_SIZE)
+            eof = not data
+            buffer += data
+            continue
+        if not buffer:
+            return
+        start = 0
+        while len(buffer) - start >= max_size or (eof and start < len(buffer)):
+            chunk_end = find_chunk_end(buffer, start, min_size, avg_size, max_size)
+            yield buffer[start:chunk_end]
+            start = chunk_end
+        buffer = buffer[start:]
+
+class ChunkStore:
+    """
+    按内容哈希保存文件块的仓库
+
+    目录结构：
+        chunks/ab/abcdef...    文件块，文件名为sha256
+        index.json             文件路径 -> (修改时间, 大小, 切块方式, 文件块列表)，文件未修改时不再重新计算哈希
+        manifests/名称-版本.json  每个版本的文件清单
+    """
+    def __init__(self, root=BUNDLE_ROOT, min_chunk_size=MIN_CHUNK_SIZE, avg_chunk_size=AVG_CHUNK_SIZE, max_chunk_size=MAX_CHUNK_SIZE):
+        if avg_chunk_size & (avg_chunk_size - 1) or not min_chunk_size < avg_chunk_size < max_chunk_size:
+            raise ValueError("平均块大小需要是2的幂，且在最小和最大块大小之间")
+        self.root = root
+        self.min_chunk_size = min_chunk_size
+        self.avg_chunk_size = avg_chunk_size
+        self.max_chunk_size = max_chunk_size
+        # 切块参数改变后，旧索引中的文件块列表不再有效
+        self.chunker = f"fastcdc-{min_chunk_size}-{avg_chunk_size}-{max_chunk_size}"
+        self.chunk_dir = os.path.join(root, 'chunks')
+        self.manifest_dir = os.path.join(root, 'manifests')
+        self.index_path = os.path.join(root, 'index.json')
+        os.makedirs(self.chunk_dir, exist_ok=True)
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+
+    def chunk_path(self, digest):
+        return os.path.join(self.chunk_dir, digest[:2], digest)
+
+    def has_chunk(self, digest):
+        return os.path.exists(self.chunk_path(digest))
+
+    def write_chunk(self, digest, data):
+        path = self.chunk_path(digest)
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再改名，避免中断后留下不完整的块
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return True
+
+    def read_chunk(self, digest):
+        with open(self.chunk_path(digest), 'rb') as f:
+            return f.read()
+
+    def add_file(self, path):
+        """
+        将文件切块存入仓库
+        :param path: 文件路径
+        :return: (文件块列表, 是否重新计算了哈希)
+        """
+        abs_path = os.path.abspath(path)
+        stat = os.stat(abs_path)
+        entry = self.index.get(abs_path)
+        if entry and entry["mtime"] == stat.st_mtime_ns and entry["size"] == stat.st_size \
+                and entry.get("chunker") == self.chunker \
+                and all(self.has_chunk(digest) for digest in entry["chunks"]):
+            INDEX_HITS.inc()
+            return entry["chunks"], False
+        INDEX_MISSES.inc()
+
+        chunks = []
+        with open(abs_path, 'rb') as f:
+            for data in iter_chunks(f, self.min_chunk_size, self.avg_chunk_size, self.max_chunk_size):
+                digest = hashlib.sha256(data).hexdigest()
+                self.write_chunk(digest, data)
+                chunks.append(digest)
+        self.index[abs_path] = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "chunker": self.chunker, "chunks": chunks}
+        return chunks, True
+
+    def save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    def manifest_path(self, name, version):
+        return os.path.join(self.manifest_dir, f"{name}-{version}.json")
+
+    def load_manifest(self, name, version):
+        with open(self.manifest_path(name, version), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+# 客户端需要的配置项，其余配置（如 remote_model_api_key）只保存在服务端，不打包
+CLIENT_CONFIG_KEYS = [
+    "Live2D_model_name",
+    "is_Live2D_model_include_gpt_sovits_model",
+    "is_Live2D_model_include_personality_prompt",
+    "is_model_support_multimodal",
+    "enable_gpt_sovits",
+]
+
+def write_client_config(config_file, model_name, output_file):
+    """
+    从服务端配置中生成客户端配置，只保留 CLIENT_CONFIG_KEYS 中的配置项
+    :param config_file: 服务端配置文件
+    :param model_name: 客户端使用的Live2D模型名称
+    :param output_file: 输出的客户端配置文件
+    """
+    with open(config_file, 'r', encoding='utf-8') as f:
+        server_config = json.load(f)
+    client_config = {key: server_config[key] for key in CLIENT_CONFIG_KEYS if key in server_config}
+    client_config["Live2D_model_name"] = model_name
+    content = json.dumps(client_config, ensure_ascii=False, indent=4)
+    # 内容没有变化时不改写文件，保持修改时间不变，重新打包时不用重新计算哈希
+    if os.path.exists(output_file):
+        with open(output_file, 'r', encoding='utf-8') as f:
+            if f.read() == content:
+                return
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+def collect_client_sources(model_name, voice_dir=None, installed_model_file='userData/installedModel.json', config_file='userData/config.json', bundle_root=BUNDLE_ROOT):
+    """
+    收集客户端需要打包的内容
+    :param model_name: 已安装的Live2D模型名称
+    :param voice_dir: 预渲染语音目录，可选
+    :param bundle_root: 打包输出目录，客户端配置生成在该目录下
+    :return: 包内路径 -> 本地路径 的字典
+    """
+    with open(installed_model_file, 'r', encoding='utf-8') as f:
+        installed_models = json.load(f)
+    if model_name not in installed_models:
+        raise KeyError(f"未安装的Live2D模型: {model_name}")
+
+    client_config_file = os.path.join(bundle_root, 'client_config', f"{model_name}.json")
+    write_client_config(config_file, model_name, client_config_file)
+    sources = {
+        f"model/{model_name}": installed_models[model_name],
+        "config/config.json": client_config_file,
+    }
+    if voice_dir:
+        sources["voice"] = voice_dir
+    return sources
+
+def build_client_bundle(name, version, sources, store=None):
+    """
+    构建客户端包的文件清单，只重新计算修改过的文件的哈希
+    :param name: 客户端包名称
+    :param version: 版本号
+    :param sources: 包内路径 -> 本地文件或文件夹路径
+    :param store: 文件块仓库，默认使用 BUNDLE_ROOT
+    :return: (文件清单, 统计信息)
+    """
+    if store is None:
+        store = ChunkStore()
+
+    files = {}
+    stats = {"文件数": 0, "重新计算哈希的文件数": 0, "总大小": 0}
+    for bundle_path, local_path in sources.items():
+        if os.path.isdir(local_path):
+            file_pairs = []
+            for root, _, filenames in os.walk(local_path):
+                for filename in filenames:
+                    file_path = os.path.join(root, filename)
+                    relative_path = os.path.relpath(file_path, local_path).replace('\\', '/')
+                    file_pairs.append((f"{bundle_path}/{relative_path}", file_path))
+        elif os.path.isfile(local_path):
+            file_pairs = [(bundle_path, local_path)]
+        else:
+            raise FileNotFoundError(f"路径 '{local_path}' 不存在。")
+
+        for file_bundle_path, file_path in sorted(file_pairs):
+            chunks, rehashed = store.add_file(file_path)
+            files[file_bundle_path] = {"size": os.path.getsize(file_path), "chunks": chunks}
+            stats["文件数"] += 1
+            stats["重新计算哈希的文件数"] += int(rehashed)
+            stats["总大小"] += files[file_bundle_path]["size"]
+    store.save_index()
+
+    manifest = {"name": name, "version": version, "chunker": store.chunker, "files": files}
+    with open(store.manifest_path(name, version), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=4)
+
+    stats["文件块数"] = len(manifest_chunks(manifest))
+    return manifest, stats
+
+def manifest_chunks(manifest):
+    """获取文件清单用到的所有文件块"""
+    return {digest for entry in manifest["files"].values() for digest in entry["chunks"]}
+
+def write_pack(store, manifest, output_file, base_manifest=None):
+    """
+    生成客户端更新包
+    :param store: 文件块仓库
+    :param manifest: 新版本的文件清单
+    :param output_file: 输出的zip文件路径
+    :param base_manifest: 客户端当前版本的文件清单，为None时生成完整包
+    :return: 包内文件块数量
+    """
+    chunks = manifest_chunks(manifest)
+    if base_manifest is not None:
+        chunks -= manifest_chunks(base_manifest)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    # 音频和贴图本身已经压缩过，不再压缩
+    with zipfile.ZipFile(output_file, 'w', compression=zipfile.ZIP_STORED) as pack:
+        pack.writestr('manifest.json', json.dumps(manifest, ensure_ascii=False))
+        for digest in sorted(chunks):
+            pack.write(store.chunk_path(digest), f"chunks/{digest}")
+    return len(chunks)
+
+def build_delta_pack(store, name, base_version, version, output_file=None):
+    """
+    生成两个版本之间的增量包
+    :return: (增量包路径, 包内文件块数量)
+    """
+    if output_file is None:
+        output_file = os.path.join(store.root, 'packs', f"{name}-{base_version}-to-{version}.zip")
+    count = write_pack(store, store.load_manifest(name, version), output_file, store.load_manifest(name, base_version))
+    return output_file, count
+
+def apply_pack(pack_file, client_store):
+    """
+    客户端安装更新包：将包内的文件块加入客户端仓库
+    :param pack_file: 更新包路径
+    :param client_store: 客户端的文件块仓库
+    :return: 新版本的文件清单
+    """
+    with zipfile.ZipFile(pack_file, 'r') as pack:
+        manifest = json.loads(pack.read('manifest.json').decode('utf-8'))
+        for item in pack.namelist():
+            if item.startswith('chunks/'):
+                data = pack.read(item)
+                digest = item[len('chunks/'):]
+                if hashlib.sha256(data).hexdigest() != digest:
+                    raise ValueError(f"文件块校验失败: {digest}")
+                client_store.write_chunk(digest, data)
+    missing = [digest for digest in manifest_chunks(manifest) if not client_store.has_chunk(digest)]
+    if missing:
+        raise ValueError(f"缺少 {len(missing)} 个文件块，请先安装完整包")
+    return manifest
+
+def restore_bundle(manifest, store, output_dir):
+    """
+    根据文件清单还原客户端文件
+    :param manifest: 文件清单
+    :param store: 文件块仓库
+    :param output_dir: 输出目录
+    """
+    for bundle_path, entry in manifest["files"].items():
+        file_path = os.path.join(output_dir, *bundle_path.split('/'))
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'wb') as f:
+            for digest in entry["chunks"]:
+                f.write(store.read_chunk(digest))
+
+def format_size(size):
+    """格式化文件大小"""
+    for unit in ["B", "KB", "MB"]:
+        if size < 1024:
+            return f"{size:.2f} {unit}"
+        size /= 1024
+    return f"{size:.2f} GB"
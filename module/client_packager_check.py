@@ -0,0 +1,133 @@
+import os
+import sys
+import json
+import random
+import zipfile
+import tempfile
+
+from module.client_packager import ChunkStore, collect_client_sources, build_client_bundle, write_pack, build_delta_pack, apply_pack, restore_bundle
+
+# 检查客户端打包的完整流程：服务端打包两个版本，客户端从空仓库安装完整包和增量包后还原文件
+# 用法: python -m module.client_packager_check
+
+MODEL_NAME = "测试模型"
+
+def make_server(root):
+    """创建测试用的Live2D模型、已安装模型列表和服务端配置"""
+    model_dir = os.path.join(root, "model")
+    os.makedirs(os.path.join(model_dir, "motions"))
+    with open(os.path.join(model_dir, "texture.png"), "wb") as f:
+        f.write(random.Random(0).randbytes(3 * 1024 * 1024))
+    with open(os.path.join(model_dir, "test.model3.json"), "w", encoding="utf-8") as f:
+        json.dump({"Version": 3}, f)
+    with open(os.path.join(model_dir, "motions", "idle.motion3.json"), "w", encoding="utf-8") as f:
+        json.dump({"Curves": []}, f)
+    installed_model_file = os.path.join(root, "installedModel.json")
+    with open(installed_model_file, "w", encoding="utf-8") as f:
+        json.dump({MODEL_NAME: model_dir}, f, ensure_ascii=False)
+    config_file = os.path.join(root, "config.json")
+    with open(config_file, "w", encoding="utf-8") as f:
+        json.dump({"enable_gpt_sovits": True, "remote_model_api_key": "不应该被打包的密钥"}, f, ensure_ascii=False)
+    return model_dir, installed_model_file, config_file
+
+def read_tree(root):
+    """读取文件夹中的所有文件: 相对路径 -> 内容"""
+    files = {}
+    for current, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(current, filename)
+            with open(path, "rb") as f:
+                files[os.path.relpath(path, root).replace('\\', '/')] = f.read()
+    return files
+
+def build_version(store, version, installed_model_file, config_file):
+    sources = collect_client_sources(MODEL_NAME, installed_model_file=installed_model_file, config_file=config_file, bundle_root=store.root)
+    manifest, _ = build_client_bundle(MODEL_NAME, version, sources, store)
+    return manifest
+
+def check_delta_round_trip():
+    """客户端安装v1完整包和v1到v2的增量包后，还原出的文件与服务端v2完全相同"""
+    root = tempfile.mkdtemp()
+    model_dir, installed_model_file, config_file = make_server(root)
+    store = ChunkStore(os.path.join(root, "bundle"))
+    manifest_v1 = build_version(store, "1", installed_model_file, config_file)
+    expected_v1 = read_tree(model_dir)
+
+    # 贴图中间插入一个字节，新增一个动作，删除一个动作
+    texture_path = os.path.join(model_dir, "texture.png")
+    with open(texture_path, "rb") as f:
+        texture = f.read()
+    with open(texture_path, "wb") as f:
+        f.write(texture[:len(texture) // 2] + b"x" + texture[len(texture) // 2:])
+    with open(os.path.join(model_dir, "motions", "tap.motion3.json"), "w", encoding="utf-8") as f:
+        json.dump({"Curves": [1]}, f)
+    os.remove(os.path.join(model_dir, "motions", "idle.motion3.json"))
+    build_version(store, "2", installed_model_file, config_file)
+    expected_v2 = read_tree(model_dir)
+
+    full_pack = os.path.join(root, "full.zip")
+    write_pack(store, manifest_v1, full_pack)
+    delta_pack, chunk_count = build_delta_pack(store, MODEL_NAME, "1", "2")
+    assert chunk_count <= 3, f"插入一个字节后增量包包含 {chunk_count} 个文件块"
+    assert os.path.getsize(delta_pack) < os.path.getsize(full_pack) / 10, "增量包没有明显小于完整包"
+
+    client_store = ChunkStore(os.path.join(root, "client"))
+    restore_bundle(apply_pack(full_pack, client_store), client_store, os.path.join(root, "client_v1"))
+    restore_bundle(apply_pack(delta_pack, client_store), client_store, os.path.join(root, "client_v2"))
+    assert read_tree(os.path.join(root, "client_v1", "model", MODEL_NAME)) == expected_v1, "还原的v1文件与服务端不同"
+    assert read_tree(os.path.join(root, "client_v2", "model", MODEL_NAME)) == expected_v2, "还原的v2文件与服务端不同"
+
+    with open(os.path.join(root, "client_v2", "config", "config.json"), "r", encoding="utf-8") as f:
+        client_config = json.load(f)
+    assert "remote_model_api_key" not in client_config, "客户端配置中包含API密钥"
+    assert client_config["Live2D_model_name"] == MODEL_NAME
+
+def check_delta_without_base():
+    """没有安装完整包时，增量包安装失败"""
+    root = tempfile.mkdtemp()
+    model_dir, installed_model_file, config_file = make_server(root)
+    store = ChunkStore(os.path.join(root, "bundle"))
+    build_version(store, "1", installed_model_file, config_file)
+    with open(os.path.join(model_dir, "test.model3.json"), "w", encoding="utf-8") as f:
+        json.dump({"Version": 4}, f)
+    build_version(store, "2", installed_model_file, config_file)
+    delta_pack, _ = build_delta_pack(store, MODEL_NAME, "1", "2")
+    try:
+        apply_pack(delta_pack, ChunkStore(os.path.join(root, "client")))
+    except ValueError:
+        return
+    raise AssertionError("空仓库安装增量包没有报错")
+
+def check_corrupted_pack():
+    """文件块内容与哈希不符时安装失败"""
+    root = tempfile.mkdtemp()
+    model_dir, installed_model_file, config_file = make_server(root)
+    store = ChunkStore(os.path.join(root, "bundle"))
+    manifest = build_version(store, "1", installed_model_file, config_file)
+    pack_file = os.path.join(root, "full.zip")
+    write_pack(store, manifest, pack_file)
+    corrupted_file = os.path.join(root, "corrupted.zip")
+    with zipfile.ZipFile(pack_file, 'r') as pack, zipfile.ZipFile(corrupted_file, 'w') as corrupted:
+        for index, item in enumerate(pack.namelist()):
+            data = pack.read(item)
+            if item.startswith('chunks/') and index == 1:
+                data = bytes([data[0] ^ 1]) + data[1:]
+            corrupted.writestr(item, data)
+    try:
+        apply_pack(corrupted_file, ChunkStore(os.path.join(root, "client")))
+    except ValueError:
+        return
+    raise AssertionError("损坏的更新包安装时没有报错")
+
+CHECKS = [check_delta_round_trip, check_delta_without_base, check_corrupted_pack]
+
+if __name__ == "__main__":
+    failed = 0
+    for check in CHECKS:
+        try:
+            check()
+            print(f"✅ {check.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {check.__name__}: {e}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,102 @@
+import io
+import sys
+import json
+import time
+import wave
+import threading
+import socketserver
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# 模拟 GPT-SoVITS api_v2 的本地服务，用于在没有模型的机器上测试 TTS 路由
+# 用法: python module/fake_tts_server.py 9880 [每个字的合成耗时(秒)] [切换模型耗时(秒)] [blocking]
+
+def make_silent_wav(duration, sample_rate=32000):
+    """生成一段静音wav"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(b'\x00\x00' * int(duration * sample_rate))
+    return buffer.getvalue()
+
+class FakeTTSHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        server = self.server
+        if url.path in ('/set_gpt_weights', '/set_sovits_weights'):
+            key = 'gpt' if url.path == '/set_gpt_weights' else 'sovits'
+            time.sleep(server.switch_delay)
+            with server.lock:
+                server.weights[key] = params.get('weights_path', [''])[0]
+                server.switch_count += 1
+            self.send_body(200, b'"success"', 'application/json')
+        else:
+            self.send_body(404, b'{"message": "not found"}', 'application/json')
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/tts':
+            self.send_body(404, b'{"message": "not found"}', 'application/json')
+            return
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        text = payload.get('text', '')
+        # GPT-SoVITS 同一时间只合成一段，这里同样串行处理
+        with self.server.synth_lock:
+            time.sleep(self.server.char_delay * len(text))
+            self.server.tts_count += 1
+        self.send_body(200, make_silent_wav(0.2 * len(text)), 'audio/wav')
+
+class FakeTTSServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, char_delay=0.0, switch_delay=0.0, blocking=False):
+        super().__init__(('127.0.0.1', port), FakeTTSHandler)
+        self.char_delay = char_delay
+        self.switch_delay = switch_delay
+        self.blocking = blocking # 为True时逐个处理请求，合成时无法响应其他请求
+        self.weights = {'gpt': None, 'sovits': None}
+        self.switch_count = 0
+        self.tts_count = 0
+        self.lock = threading.Lock()
+        self.synth_lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        # api_v2 在异步接口中同步推理，合成时事件循环被阻塞，健康检查等请求都要等合成结束
+        if self.blocking:
+            socketserver.TCPServer.process_request(self, request, client_address)
+        else:
+            super().process_request(request, client_address)
+
+    def handle_error(self, request, client_address):
+        # 客户端超时后断开连接属于正常情况，不输出错误
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        """在后台线程中启动服务"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 9880
+    char_delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    switch_delay = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+    blocking = len(sys.argv) > 4 and sys.argv[4] == 'blocking'
+    FakeTTSServer(port, char_delay, switch_delay, blocking).serve_forever()
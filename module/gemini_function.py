@@ -9,6 +9,8 @@ os.environ["HTTPS_PROXY"] = "http://127.0.0.1:7890"
 
 import google.generativeai as genai
 
+from module.metrics import STAGE_LATENCY, BACKEND_ERRORS
+
 from IPython.display import display
 from IPython.display import Markdown
 
@@ -34,6 +36,32 @@ for m in genai.list_models():
 
 model=genai.GenerativeModel(model_name="gemini-2.0-flash")
 
+def gemini_stream_text(prompt, model_name="gemini-2.0-flash"):
+    """
+    流式生成文本
+    :param prompt: 输入提示
+    :param model_name: 模型名称
+    :return: 生成器，依次产出文本块
+    """
+    model = genai.GenerativeModel(model_name=model_name)
+    try:
+        with STAGE_LATENCY.labels("llm").time():
+            for chunk in model.generate_content(prompt, stream=True):
+                yield chunk.text
+    except Exception:
+        BACKEND_ERRORS.labels("gemini").inc()
+        raise
+
+def gemini_speak(prompt, speech_pipeline, model_name="gemini-2.0-flash"):
+    """
+    流式生成文本并合成语音，开启提前回复时LLM输出第一个分句就开始合成
+    :param prompt: 输入提示
+    :param speech_pipeline: speculative_tts.SpeculativeReplyPipeline
+    :param model_name: 模型名称
+    :return: 生成器，依次产出 (文本, 音频数据)
+    """
+    return speech_pipeline.run(gemini_stream_text(prompt, model_name))
+
 def gemini_generate_text(prompt, model_name="gemini-2.0-flash"):
     """
     生成文本的函数
@@ -44,21 +72,17 @@ def gemini_generate_text(prompt, model_name="gemini-2.0-flash"):
     os.environ["HTTP_PROXY"] = "http://127.0.0.1:7890"
     os.environ["HTTPS_PROXY"] = "http://127.0.0.1:7890"
 
-    model=genai.GenerativeModel(model_name="gemini-2.0-flash")
-    prompt = prompt # 输入提示
     output_filename = "gemini_response_output.txt" # 定义输出文件名
 
-    response = model.generate_content(prompt, stream=True)
-
     print(f"Streaming response to console and writing to {output_filename}...")
     try:
         # 使用 'w' 模式打开文件（如果文件存在则覆盖），指定 utf-8 编码
         with open(output_filename, "w", encoding="utf-8") as f:
-            for chunk in response:
+            for text in gemini_stream_text(prompt, model_name):
                 # 打印到控制台（可选）
-                print(chunk.text, end='', flush=True)
+                print(text, end='', flush=True)
                 # 写入文件
-                f.write(chunk.text)
+                f.write(text)
         print(f"\nFinished writing response to {output_filename}") # 换行并提示完成
     except Exception as e:
         print(f"\nAn error occurred during streaming or writing: {e}")
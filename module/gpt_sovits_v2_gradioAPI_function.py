@@ -1,34 +1,97 @@
 import requests
 import json
 
-# 读取配置文件
-with open('module/gpt_sovits_model_config.json', 'r', encoding='utf-8') as f:
-    config = json.load(f)
-
-# 选择要使用的语音模型
-voice_name = "Fairy"  # 例如使用 Fairy 模型
-model_config = config[voice_name]
-
-# 先切换 GPT 和 SoVITS 模型
-requests.get("http://127.0.0.1:9880/set_gpt_weights", params={
-    "weights_path": model_config["weight-path"]
-})
-requests.get("http://127.0.0.1:9880/set_sovits_weights", params={
-    "weights_path": model_config["sovits-path"]
-})
-
-# 然后进行 TTS 合成
-url = "http://127.0.0.1:9880/tts"
-payload = {
-    "text": "你好，这是一段测试文本。",
-    "text_lang": "zh",
-    "ref_audio_path": model_config["ref-audio-path"],
-    "prompt_text": model_config["prompt-text"],
-    "prompt_lang": "zh",
-    "text_split_method": "cut5",
-    "media_type": "wav"
+from module.metrics import STAGE_LATENCY, BACKEND_ERRORS
+
+# GPT-SoVITS api_v2 默认地址
+GPT_SOVITS_URL = "http://127.0.0.1:9880"
+
+SWITCH_WEIGHTS_LATENCY = STAGE_LATENCY.labels("tts_switch_weights")
+TTS_LATENCY = STAGE_LATENCY.labels("tts")
+TTS_ERRORS = BACKEND_ERRORS.labels("gpt_sovits")
+
+# GPT-SoVITS 支持的文本切分方式
+TEXT_SPLIT_METHODS = {
+    "cut0": "不切",
+    "cut1": "凑四句一切",
+    "cut2": "凑50字一切",
+    "cut3": "按中文句号。切",
+    "cut4": "按英文句号.切",
+    "cut5": "按标点符号切",
 }
 
-response = requests.post(url, json=payload)
-with open("output.wav", "wb") as f:
-    f.write(response.content)
\ No newline at end of file
+def load_model_config(config_path='module/gpt_sovits_model_config.json'):
+    """
+    读取语音模型配置文件
+    :param config_path: 配置文件路径
+    :return: 语音名称到模型配置的字典
+    """
+    with open(config_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def set_model_weights(model_config, base_url=GPT_SOVITS_URL, timeout=None):
+    """
+    切换 GPT 和 SoVITS 模型
+    :param model_config: 单个语音的模型配置
+    :param base_url: GPT-SoVITS 服务地址
+    :param timeout: 请求超时（秒）
+    """
+    try:
+        with SWITCH_WEIGHTS_LATENCY.time():
+            response = requests.get(f"{base_url}/set_gpt_weights", params={
+                "weights_path": model_config["weight-path"]
+            }, timeout=timeout)
+            response.raise_for_status()
+            response = requests.get(f"{base_url}/set_sovits_weights", params={
+                "weights_path": model_config["sovits-path"]
+            }, timeout=timeout)
+            response.raise_for_status()
+    except requests.RequestException:
+        TTS_ERRORS.inc()
+        raise
+
+def synthesize(text, model_config, text_split_method="cut5", base_url=GPT_SOVITS_URL, media_type="wav", timeout=None):
+    """
+    进行 TTS 合成
+    :param text: 要合成的文本
+    :param model_config: 单个语音的模型配置
+    :param text_split_method: 文本切分方式，见 TEXT_SPLIT_METHODS
+    :param base_url: GPT-SoVITS 服务地址
+    :param media_type: 输出音频格式
+    :param timeout: 请求超时（秒）
+    :return: 音频数据
+    """
+    payload = {
+        "text": text,
+        "text_lang": "zh",
+        "ref_audio_path": model_config["ref-audio-path"],
+        "prompt_text": model_config["prompt-text"],
+        "prompt_lang": "zh",
+        "text_split_method": text_split_method,
+        "media_type": media_type
+    }
+
+    try:
+        with TTS_LATENCY.time():
+            response = requests.post(f"{base_url}/tts", json=payload, timeout=timeout)
+            response.raise_for_status()
+    except requests.RequestException:
+        TTS_ERRORS.inc()
+        raise
+    return response.content
+
+if __name__ == "__main__":
+    # 读取配置文件
+    config = load_model_config()
+
+    # 选择要使用的语音模型
+    voice_name = "Fairy"  # 例如使用 Fairy 模型
+    model_config = config[voice_name]
+
+    # 先切换 GPT 和 SoVITS 模型
+    set_model_weights(model_config)
+
+    # 然后进行 TTS 合成
+    audio = synthesize("你好，这是一段测试文本。", model_config)
+    with open("output.wav", "wb") as f:
+        f.write(audio)
@@ -0,0 +1,379 @@
+import os
+import math
+import time
+import bisect
+import weakref
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import psutil
+
+# /metrics 服务端口和监听地址，默认只监听本机；需要远程抓取时在配置中改为 0.0.0.0
+METRICS_PORT = 7861
+METRICS_HOST = '127.0.0.1'
+
+# 默认的延迟分桶（秒）
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32)
+
+class ShardHolder:
+    """线程的计数，保存在 threading.local 中，线程结束时被回收"""
+    __slots__ = ("values", "__weakref__")
+
+    def __init__(self, size):
+        self.values = [0] * size
+
+class ThreadShards:
+    """
+    每个线程写自己的一组计数，抓取时再汇总，热路径上不需要和其他线程争用同一把锁
+    只有线程第一次写入时需要加锁登记；线程结束后它的计数合并到 base 中，
+    线程池反复创建线程时分片数量不会一直增长
+    """
+    def __init__(self, size):
+        self.size = size
+        self.local = threading.local()
+        self.shards = {}
+        self.base = [0] * size
+        # 合并在回收线程计数时调用，可能发生在任意线程中，使用可重入锁
+        self.lock = threading.RLock()
+
+    def get(self):
+        try:
+            return self.local.values
+        except AttributeError:
+            holder = ShardHolder(self.size)
+            with self.lock:
+                self.shards[id(holder)] = holder.values
+            weakref.finalize(holder, self.fold, id(holder), holder.values)
+            # holder 只用于在线程结束时触发合并，热路径直接读取 values
+            self.local.holder = holder
+            self.local.values = holder.values
+            return holder.values
+
+    def fold(self, key, values):
+        """将已结束线程的计数合并到 base"""
+        with self.lock:
+            self.shards.pop(key, None)
+            for index, value in enumerate(values):
+                self.base[index] += value
+
+    def sum(self):
+        with self.lock:
+            totals = list(self.base)
+            shards = list(self.shards.values())
+        for values in shards:
+            for index, value in enumerate(values):
+                totals[index] += value
+        return totals
+
+class CounterChild:
+    def __init__(self):
+        self.shards = ThreadShards(1)
+
+    def inc(self, amount=1):
+        self.shards.get()[0] += amount
+
+    def samples(self, name, labels):
+        return [(name, labels, self.shards.sum()[0])]
+
+class HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # 每个分桶的计数，最后两项为 +Inf 分桶计数和总和
+        self.shards = ThreadShards(len(buckets) + 2)
+
+    def observe(self, value):
+        values = self.shards.get()
+        values[bisect.bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+    def time(self):
+        """记录代码块耗时: with histogram.labels("tts").time(): ..."""
+        return Timer(self)
+
+    def samples(self, name, labels):
+        totals = self.shards.sum()
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, totals):
+            cumulative += count
+            samples.append((f"{name}_bucket", labels + [("le", format_value(bound))], cumulative))
+        cumulative += totals[-2]
+        samples.append((f"{name}_bucket", labels + [("le", "+Inf")], cumulative))
+        samples.append((f"{name}_count", labels, cumulative))
+        samples.append((f"{name}_sum", labels, totals[-1]))
+        return samples
+
+class Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+class MetricFamily:
+    """
+    带标签的指标，labels() 返回对应标签值的子指标，子指标创建后可以保存下来重复使用
+    子类通过 metric_type 和 child_class 指定指标类型和子指标类，child_args 为创建子指标时的参数；
+    直接使用时为只有一个值的 untyped 指标
+    """
+    metric_type = "untyped"
+    child_class = CounterChild
+    child_args = ()
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def new_child(self):
+        return self.child_class(*self.child_args)
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} 需要标签 {self.labelnames}")
+            with self.lock:
+                child = self.children.setdefault(values, self.new_child())
+        return child
+
+    def collect(self):
+        samples = []
+        for values, child in list(self.children.items()):
+            samples.extend(child.samples(self.name, list(zip(self.labelnames, values))))
+        return self.name, self.metric_type, self.documentation, samples
+
+class Counter(MetricFamily):
+    metric_type = "counter"
+    child_class = CounterChild
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+class Histogram(MetricFamily):
+    metric_type = "histogram"
+    child_class = HistogramChild
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        self.child_args = (self.buckets,)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+class Registry:
+    """
+    指标注册表
+    collector 为抓取时调用的函数，返回 [(名称, 类型, 说明, [(名称, 标签列表, 值)])]，用于进程、GPU、队列等状态值
+    """
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+
+    def add_collector(self, collector):
+        with self.lock:
+            self.collectors.append(collector)
+
+    def remove_collector(self, collector):
+        with self.lock:
+            if collector in self.collectors:
+                self.collectors.remove(collector)
+
+    def collect(self):
+        with self.lock:
+            metrics = list(self.metrics)
+            collectors = list(self.collectors)
+        families = [metric.collect() for metric in metrics]
+        for collector in collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                print(f"指标收集失败: {e}")
+        return families
+
+    def render(self):
+        """生成 Prometheus 文本格式"""
+        lines = []
+        for name, metric_type, documentation, samples in self.collect():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label_value(value)}"' for key, value in labels) + "}"
+
+def format_value(value):
+    # GPUtil 读不到数据时返回 NaN，Prometheus 文本格式用 NaN、+Inf、-Inf 表示
+    if isinstance(value, float) and math.isnan(value):
+        return "NaN"
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if isinstance(value, float) and value == int(value) and abs(value) < 1e15:
+        return f"{value:.1f}"
+    return str(value)
+
+REGISTRY = Registry()
+
+STAGE_LATENCY = Histogram("desktopgirl_stage_latency_seconds", "各阶段耗时（llm: LLM回复, tts: 语音合成, tts_switch_weights: 切换语音模型）", ["stage"])
+BACKEND_ERRORS = Counter("desktopgirl_backend_errors_total", "后端请求失败次数", ["backend"])
+CACHE_REQUESTS = Counter("desktopgirl_cache_requests_total", "缓存查询次数，按命中与否统计", ["cache", "result"])
+
+# 复用同一个Process对象，cpu_percent() 才能计算两次抓取之间的CPU使用率
+PROCESS = psutil.Process(os.getpid())
+
+def collect_process_metrics():
+    """服务端进程资源占用，与 get_server_resource_usage 的字段相同"""
+    process = PROCESS
+    try:
+        file_handles = process.num_fds() if hasattr(process, 'num_fds') else len(process.open_files())
+    except Exception:
+        file_handles = None
+    families = [
+        ("desktopgirl_process_cpu_percent", "gauge", "进程CPU使用率", [("desktopgirl_process_cpu_percent", [], process.cpu_percent())]),
+        ("desktopgirl_process_resident_memory_bytes", "gauge", "进程内存使用", [("desktopgirl_process_resident_memory_bytes", [], process.memory_info().rss)]),
+        ("desktopgirl_process_memory_percent", "gauge", "进程内存使用率", [("desktopgirl_process_memory_percent", [], process.memory_percent())]),
+        ("desktopgirl_process_threads", "gauge", "进程线程数", [("desktopgirl_process_threads", [], process.num_threads())]),
+        ("desktopgirl_process_start_time_seconds", "gauge", "进程启动时间", [("desktopgirl_process_start_time_seconds", [], process.create_time())]),
+        ("desktopgirl_process_uptime_seconds", "gauge", "进程运行时间", [("desktopgirl_process_uptime_seconds", [], time.time() - process.create_time())]),
+    ]
+    if file_handles is not None:
+        families.append(("desktopgirl_process_open_fds", "gauge", "进程文件句柄数", [("desktopgirl_process_open_fds", [], file_handles)]))
+    return families
+
+def collect_gpu_metrics():
+    """GPU状态，没有GPU或没有安装GPUtil时不输出"""
+    try:
+        import GPUtil
+        gpus = GPUtil.getGPUs()
+    except Exception:
+        return []
+    fields = [
+        ("desktopgirl_gpu_memory_total_bytes", "显存总量", lambda gpu: gpu.memoryTotal * 1024 * 1024),
+        ("desktopgirl_gpu_memory_used_bytes", "显存使用", lambda gpu: gpu.memoryUsed * 1024 * 1024),
+        ("desktopgirl_gpu_utilization_ratio", "GPU使用率", lambda gpu: gpu.load),
+        ("desktopgirl_gpu_temperature_celsius", "GPU温度", lambda gpu: gpu.temperature),
+    ]
+    return [
+        (name, "gauge", documentation, [(name, [("gpu", str(i)), ("name", gpu.name)], getter(gpu)) for i, gpu in enumerate(gpus)])
+        for name, documentation, getter in fields
+    ]
+
+REGISTRY.add_collector(collect_process_metrics)
+REGISTRY.add_collector(collect_gpu_metrics)
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST, registry=REGISTRY):
+    """
+    在后台线程中启动 /metrics 服务
+    :param port: 端口
+    :param host: 监听地址
+    :return: HTTP服务
+    """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# 每次埋点调用允许的最大耗时（纳秒），LLM和语音合成调用都在秒级，几微秒以内的开销可以忽略
+MAX_OVERHEAD_NS = 2000
+
+def benchmark_overhead(iterations=1000000, threads=4):
+    """
+    测试埋点开销，加锁计数作为对照
+    :param iterations: 每个线程的调用次数
+    :param threads: 线程数
+    :return: 每次调用的平均耗时（纳秒）
+    """
+    registry = Registry()
+    counter = Counter("benchmark_total", "benchmark", ["backend"], registry=registry).labels("gpt_sovits")
+    histogram = Histogram("benchmark_seconds", "benchmark", ["stage"], registry=registry).labels("tts")
+
+    lock = threading.Lock()
+    locked_counter = [0]
+
+    def baseline():
+        pass
+
+    def locked_inc():
+        with lock:
+            locked_counter[0] += 1
+
+    cases = {
+        "空函数调用": lambda: baseline(),
+        "加锁计数（对照）": lambda: locked_inc(),
+        "Counter.inc": lambda: counter.inc(),
+        "Histogram.observe": lambda: histogram.observe(0.3),
+    }
+    results = {}
+    for case_name, fn in cases.items():
+        def run():
+            for _ in range(iterations):
+                fn()
+        workers = [threading.Thread(target=run) for _ in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        results[case_name] = (time.perf_counter() - start) / (iterations * threads) * 1e9
+    assert counter.shards.sum()[0] == iterations * threads
+    return results
+
+def check_overhead(results, max_overhead_ns=MAX_OVERHEAD_NS):
+    """
+    检查埋点开销是否超过上限
+    :param results: benchmark_overhead 的结果
+    :return: 超过上限的埋点
+    """
+    return [case_name for case_name in ("Counter.inc", "Histogram.observe") if results[case_name] > max_overhead_ns]
+
+if __name__ == "__main__":
+    import sys
+
+    results = benchmark_overhead()
+    for case_name, nanoseconds in results.items():
+        print(f"{case_name}: {nanoseconds:.0f} ns")
+    failed = check_overhead(results)
+    if failed:
+        print(f"❌ 埋点开销超过 {MAX_OVERHEAD_NS} ns: {', '.join(failed)}")
+        sys.exit(1)
+    print(f"✅ 埋点开销低于 {MAX_OVERHEAD_NS} ns")
@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 
 def print_tree_and_collect_paths(start_path='.', prefix='', collected_paths=None):
@@ -132,11 +133,13 @@ def generate_voice_model_config(directory='.', output_file=None):
     
     return json_str
 
-def auto_generate_config():
+def auto_generate_config(voice_bank_path='D:\\1AAAFiles\\666_files\\AI\\txt2voice\\voiceBank'):
     """
     Automatically generate the voice model configuration and save to the specified file.
+    
+    Args:
+        voice_bank_path (str): The root directory containing voice model folders
     """
-    voice_bank_path = 'D:\\1AAAFiles\\666_files\\AI\\txt2voice\\voiceBank'
     output_json_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gpt_sovits_model_config.json')
     
     print(f"Scanning voice models from: {voice_bank_path}")
@@ -153,5 +156,9 @@ if __name__ == '__main__':
     # tree('D:\\1AAAFiles\\666_files\\AI\\txt2voice\\voiceBank')
     
     # Generate voice model configuration
-    auto_generate_config()
+    # python module/scanner.py [voice_bank_path]
+    if len(sys.argv) > 1:
+        auto_generate_config(sys.argv[1])
+    else:
+        auto_generate_config()
 
@@ -0,0 +1,183 @@
+import queue
+import threading
+
+from module.gpt_sovits_v2_gradioAPI_function import TEXT_SPLIT_METHODS
+from module.tts_router import TTSRouter
+
+# 可以安全断开的中文分句标点
+CLAUSE_PUNCTUATION = "，、…！？。"
+
+# 句末标点，用于逐句合成
+SENTENCE_PUNCTUATION = "。！？"
+
+# 与 GPT-SoVITS 切分方式一致的断句标点，保证提前合成的分句与整段合成时的停顿位置相同
+SPLIT_METHOD_PUNCTUATION = {
+    "cut3": "。",
+    "cut4": ".",
+    "cut5": CLAUSE_PUNCTUATION + ",.;?!：",
+}
+
+def get_split_punctuation(text_split_method):
+    """
+    获取某种切分方式对应的断句标点
+    :param text_split_method: 文本切分方式，见 TEXT_SPLIT_METHODS
+    :return: 断句标点字符串
+    """
+    if text_split_method not in TEXT_SPLIT_METHODS:
+        raise ValueError(f"未知的文本切分方式: {text_split_method}")
+    # cut0/cut1/cut2 不按标点切分，退回中文分句标点
+    return SPLIT_METHOD_PUNCTUATION.get(text_split_method, CLAUSE_PUNCTUATION)
+
+def find_clause_boundary(text, min_chars, punctuation=CLAUSE_PUNCTUATION, last=False):
+    """
+    查找分句边界
+    :param text: 已收到的文本
+    :param min_chars: 分句的最少字数，短于该字数的分句不会被切出
+    :param punctuation: 断句标点
+    :param last: 为True时返回最后一个边界，否则返回最早的边界
+    :return: 边界位置（包含标点），找不到时返回None
+    """
+    boundary = None
+    for index, char in enumerate(text):
+        if char not in punctuation or index + 1 < min_chars:
+            continue
+        # 连续的标点（如“……”、“！？”）作为一个整体，不从中间断开；
+        # 文本末尾的标点后面可能还有标点没收到，等下一个字到达或输出结束再断开
+        if index + 1 == len(text) or text[index + 1] in punctuation:
+            continue
+        # 与 GPT-SoVITS 的 cut4/cut5 相同，数字之间的小数点不断开
+        if char == '.' and index > 0 and text[index - 1].isdigit() and text[index + 1].isdigit():
+            continue
+        boundary = index + 1
+        if not last:
+            break
+    return boundary
+
+class SpeculativeReplyPipeline:
+    """
+    提前回复：在LLM的第一个分句到达时立即合成并播放，其余文本在LLM继续输出时分批合成
+
+    min_clause_chars 越小首句出声越早，但TTS调用次数越多、首句越容易过短；
+    flush_chars 为后续分批合成的最少字数，为0时剩余文本等LLM输出完毕后一次合成。
+    synthesize_fn 需要在合成前加载对应语音的权重，默认使用连接本地GPT-SoVITS的 TTSRouter。
+    """
+    def __init__(self, model_config, enable=True, min_clause_chars=6, flush_chars=0, text_split_method="cut5", synthesize_fn=None, punctuation=None):
+        self.model_config = model_config
+        self.enable = enable
+        self.min_clause_chars = min_clause_chars
+        self.flush_chars = flush_chars
+        self.text_split_method = text_split_method
+        self.punctuation = punctuation or get_split_punctuation(text_split_method)
+        self.synthesize_fn = synthesize_fn or TTSRouter().synthesize
+
+    def iter_segments(self, text_chunks):
+        """
+        将流式文本切分为需要合成的片段
+        :param text_chunks: LLM流式输出的文本块
+        :return: 生成器，依次产出要合成的文本
+        """
+        buffer = ""
+        first_clause_sent = not self.enable
+        for chunk in text_chunks:
+            buffer += chunk
+            if not first_clause_sent:
+                boundary = find_clause_boundary(buffer, self.min_clause_chars, self.punctuation)
+                if boundary is None:
+                    continue
+                yield buffer[:boundary]
+                buffer = buffer[boundary:]
+                first_clause_sent = True
+            if self.flush_chars and len(buffer) >= self.flush_chars:
+                boundary = find_clause_boundary(buffer, self.flush_chars, self.punctuation, last=True)
+                if boundary is not None:
+                    yield buffer[:boundary]
+                    buffer = buffer[boundary:]
+        if buffer.strip():
+            yield buffer
+
+    def run(self, text_chunks):
+        """
+        流式合成回复，LLM文本在后台线程中读取和切分，合成时LLM继续输出
+        :param text_chunks: LLM流式输出的文本块
+        :return: 生成器，依次产出 (文本, 音频数据)
+        """
+        segments = queue.Queue()
+        finished = object()
+
+        def read_text():
+            try:
+                for segment in self.iter_segments(text_chunks):
+                    segments.put(segment)
+            except Exception as e:
+                segments.put(e)
+            segments.put(finished)
+
+        threading.Thread(target=read_text, daemon=True).start()
+        while True:
+            segment = segments.get()
+            if segment is finished:
+                return
+            if isinstance(segment, Exception):
+                raise segment
+            # 每段都使用同一参考音频和切分方式，保持前后语调连贯
+            yield segment, self.synthesize_fn(segment, self.model_config, text_split_method=self.text_split_method)
+
+# 典型的人物回复，用于测试
+SAMPLE_PERSONA_REPLIES = [
+    "呜啊，好生气！我决定给你起一个难听的绰号，就叫你小笨蛋吧！谁让你把我的甜甜花酿鸡吃掉了，哼！",
+    "你没事吧？是不是肚子饿得厉害？前面好像有一家餐馆，我们去看看有什么好吃的吧，派蒙请客……才怪！",
+    "欸？不行不行，怎么又是这种要求？旅行者，我们还是先去冒险家协会交任务吧，凯瑟琳还在等着我们呢。",
+    "那当然，吃好吃的，喝好喝的，都是生活中很重要的追求。饿了就要吃好吃的，困了就要躺在床上好好休息，不可以勉强自己。",
+]
+
+def benchmark_speculative_reply(replies=SAMPLE_PERSONA_REPLIES, chunk_chars=12, chunk_interval=0.25, tts_overhead=0.6, tts_per_char=0.08, settings=None):
+    """
+    测试不同提前回复设置下的首句出声延迟与TTS调用次数（模拟计时，不需要启动LLM和GPT-SoVITS）
+    :param replies: 测试用的人物回复
+    :param chunk_chars: LLM每个文本块的字数
+    :param chunk_interval: LLM每个文本块的间隔（秒）
+    :param tts_overhead: 每次TTS调用的固定耗时（秒）
+    :param tts_per_char: TTS每个字的耗时（秒）
+    :param settings: 要测试的 (名称, SpeculativeReplyPipeline参数) 列表
+    :return: 每种设置的平均首句延迟和平均调用次数
+    """
+    if settings is None:
+        settings = [
+            ("整段合成", dict(enable=False)),
+            # 对照组：逐句合成，每收到一个完整句子就合成
+            ("逐句合成（对照）", dict(enable=False, flush_chars=1, punctuation=SENTENCE_PUNCTUATION)),
+            ("提前回复 首句4字", dict(min_clause_chars=4)),
+            ("提前回复 首句6字", dict(min_clause_chars=6)),
+            ("提前回复 首句10字", dict(min_clause_chars=10)),
+            ("提前回复 首句6字 分批20字", dict(min_clause_chars=6, flush_chars=20)),
+        ]
+
+    results = []
+    for setting_name, kwargs in settings:
+        pipeline = SpeculativeReplyPipeline(None, synthesize_fn=lambda *args, **_: None, **kwargs)
+        total_latency = 0.0
+        total_calls = 0
+        for reply in replies:
+            clock = {"now": 0.0}
+
+            def stream():
+                for start in range(0, len(reply), chunk_chars):
+                    clock["now"] = (start // chunk_chars + 1) * chunk_interval
+                    yield reply[start:start + chunk_chars]
+
+            segments = []
+            for segment in pipeline.iter_segments(stream()):
+                segments.append((clock["now"], segment))
+            ready_time, first_segment = segments[0]
+            total_latency += ready_time + tts_overhead + tts_per_char * len(first_segment)
+            total_calls += len(segments)
+        results.append({
+            "设置": setting_name,
+            "平均首句延迟": f"{total_latency / len(replies):.2f} s",
+            "平均TTS调用次数": f"{total_calls / len(replies):.2f}",
+        })
+    return results
+
+if __name__ == "__main__":
+    for result in benchmark_speculative_reply():
+        print(result)
@@ -0,0 +1,317 @@
+import os
+import sys
+import time
+import threading
+import subprocess
+import requests
+
+from module.gpt_sovits_v2_gradioAPI_function import GPT_SOVITS_URL, set_model_weights, synthesize
+from module.metrics import REGISTRY
+
+# 本地 GPT-SoVITS 进程的启动命令，在 GPT-SoVITS 目录下运行，{port} 会被替换为端口号
+DEFAULT_LOCAL_COMMAND = [sys.executable, "api_v2.py", "-a", "127.0.0.1", "-p", "{port}"]
+
+# 本地进程的输出日志目录
+LOCAL_WORKER_LOG_DIR = 'userData/logs'
+
+# 单次合成的默认超时（秒），只用CPU推理时长回复可能需要几分钟
+DEFAULT_TIMEOUT = 300
+
+# 本地进程启动失败后的重试等待时间（秒），连续失败时加倍
+RESTART_BACKOFF = 5
+MAX_RESTART_BACKOFF = 300
+
+def voice_key(model_config):
+    """用GPT和SoVITS权重路径标识一个语音"""
+    return (model_config["weight-path"], model_config["sovits-path"])
+
+class TTSInstance:
+    """一个GPT-SoVITS服务实例"""
+    def __init__(self, base_url, process=None):
+        self.base_url = base_url
+        self.process = process # 由路由器启动的本地进程，外部实例为None
+        self.healthy = process is None # 本地进程需要等待健康检查通过
+        self.loaded_voice = None # 实例上已经加载的语音
+        self.assigned_voice = None # 最后一个分配到该实例的请求的语音
+        self.in_flight = 0 # 正在合成和排队的请求数
+        self.idle_since = time.time()
+        self.lock = threading.Lock() # GPT-SoVITS同一时间只能加载一个语音，切换模型和合成需要串行
+        self.started = False # 本地进程是否通过过健康检查
+        self.log_file = None
+        self.last_success = 0 # 最后一次成功响应的时间
+
+class TTSRouter:
+    """
+    管理多个GPT-SoVITS实例的TTS路由器
+
+    请求优先发往已经加载了对应语音的实例，避免反复切换模型；
+    该实例排队过多（超过最空闲实例 affinity_slack 个请求）时发往最空闲的实例。
+    后台定时检查实例健康状态，并在 min_local_workers 和 max_local_workers 之间伸缩本地进程数。
+    请求超过 timeout 秒没有返回时直接报错，不换实例重试：实例仍在合成，重试只会重复合成同一段文本。
+    """
+    def __init__(self, endpoints=(GPT_SOVITS_URL,), local_command=None, local_cwd=None, min_local_workers=0, max_local_workers=0,
+                 local_base_port=9881, affinity_slack=2, scale_up_load=2, scale_down_idle=60,
+                 health_check_interval=5, timeout=DEFAULT_TIMEOUT, log_dir=LOCAL_WORKER_LOG_DIR):
+        self.instances = [TTSInstance(url) for url in endpoints]
+        self.local_command = local_command or DEFAULT_LOCAL_COMMAND
+        self.local_cwd = local_cwd # GPT-SoVITS 目录
+        self.log_dir = log_dir
+        self.min_local_workers = min_local_workers
+        self.max_local_workers = max(max_local_workers, min_local_workers)
+        self.local_base_port = local_base_port
+        self.affinity_slack = affinity_slack
+        self.scale_up_load = scale_up_load
+        self.scale_down_idle = scale_down_idle
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.health_thread = None
+        self.start_failures = 0
+        self.next_start_time = 0
+
+    def select_instance(self, voice, exclude=()):
+        """
+        为请求选择实例
+        :param voice: 请求的语音
+        :param exclude: 已经失败过的实例
+        :return: 选中的实例
+        """
+        with self.lock:
+            candidates = [i for i in self.instances if i.healthy and i not in exclude]
+            if not candidates:
+                raise RuntimeError("没有可用的GPT-SoVITS实例")
+            # 同样空闲时优先还没有加载语音的实例，避免不同语音挤在同一个实例上反复切换
+            least_loaded = min(candidates, key=lambda i: (i.in_flight, i.assigned_voice is not None))
+            affine = [i for i in candidates if i.assigned_voice == voice]
+            instance = least_loaded
+            if affine:
+                best_affine = min(affine, key=lambda i: i.in_flight)
+                if best_affine.in_flight <= least_loaded.in_flight + self.affinity_slack:
+                    instance = best_affine
+            instance.in_flight += 1
+            instance.assigned_voice = voice
+            return instance
+
+    def release_instance(self, instance):
+        with self.lock:
+            instance.in_flight -= 1
+            if instance.in_flight == 0:
+                instance.idle_since = time.time()
+
+    def mark_unhealthy(self, instance, forget_voice=True):
+        """
+        标记实例不可用
+        :param forget_voice: 实例可能已经重启时为True，恢复后需要重新加载语音
+        """
+        with self.lock:
+            instance.healthy = False
+            if forget_voice:
+                instance.loaded_voice = None
+                instance.assigned_voice = None
+
+    def synthesize(self, text, model_config, text_split_method="cut5"):
+        """
+        进行 TTS 合成，参数与 gpt_sovits_v2_gradioAPI_function.synthesize 相同
+        :return: 音频数据
+        """
+        voice = voice_key(model_config)
+        tried = set()
+        last_error = None
+        while True:
+            try:
+                instance = self.select_instance(voice, tried)
+            except RuntimeError:
+                if last_error is None:
+                    raise
+                raise RuntimeError(f"TTS合成失败: {last_error}")
+            tried.add(instance)
+            try:
+                with instance.lock:
+                    if instance.loaded_voice != voice:
+                        instance.loaded_voice = None
+                        set_model_weights(model_config, instance.base_url, self.timeout)
+                        instance.loaded_voice = voice
+                    audio = synthesize(text, model_config, text_split_method, instance.base_url, timeout=self.timeout)
+                instance.last_success = time.time()
+                return audio
+            except requests.ReadTimeout as e:
+                # 实例仍在运行，只是合成太慢，不标记为不可用
+                raise RuntimeError(f"TTS合成超时（{self.timeout} 秒）: {e}") from e
+            except requests.HTTPError as e:
+                # 4xx是请求本身的问题，换实例也没用
+                if e.response is not None and e.response.status_code < 500:
+                    raise
+                self.mark_unhealthy(instance)
+                last_error = e
+            except requests.RequestException as e:
+                self.mark_unhealthy(instance)
+                last_error = e
+            finally:
+                self.release_instance(instance)
+
+    def check_health(self, instance):
+        """
+        检查实例是否可用，GPT-SoVITS没有健康检查接口，能返回任何HTTP响应即视为可用
+        :return: (是否可用, 是否可能已经重启)
+        """
+        if instance.process is not None and instance.process.poll() is not None:
+            return False, True
+        try:
+            requests.get(instance.base_url, timeout=2)
+            instance.last_success = time.time()
+            return True, False
+        except requests.Timeout:
+            # 进程还在但没有响应，可能正在为其他客户端合成，已加载的语音不变
+            return False, False
+        except requests.RequestException:
+            return False, True
+
+    def run_health_checks(self):
+        for instance in list(self.instances):
+            # api_v2 在异步接口中同步推理，合成时无法响应健康检查；
+            # 有请求正在进行或刚刚成功响应过的实例视为可用，不再探测
+            busy = instance.in_flight > 0 or time.time() - instance.last_success < self.health_check_interval
+            if instance.healthy and busy and (instance.process is None or instance.process.poll() is None):
+                continue
+            healthy, restarted = self.check_health(instance)
+            if not healthy:
+                self.mark_unhealthy(instance, forget_voice=restarted)
+            elif not instance.healthy:
+                with self.lock:
+                    instance.healthy = True
+                    if instance.process is not None:
+                        instance.started = True
+                        self.start_failures = 0
+            if instance.process is not None and instance.process.poll() is not None:
+                # 本地进程已经退出，由 autoscale 重新补足
+                print(f"本地GPT-SoVITS进程 {instance.base_url} 已退出，返回码 {instance.process.returncode}，日志见 {instance.log_file}")
+                if not instance.started:
+                    self.record_start_failure()
+                with self.lock:
+                    self.instances.remove(instance)
+
+    def record_start_failure(self):
+        """连续启动失败时推迟下一次启动，避免每次健康检查都重新拉起一个会失败的进程"""
+        with self.lock:
+            self.start_failures += 1
+            backoff = min(RESTART_BACKOFF * 2 ** (self.start_failures - 1), MAX_RESTART_BACKOFF)
+            self.next_start_time = time.time() + backoff
+        print(f"本地GPT-SoVITS进程启动失败，{backoff} 秒后重试")
+
+    def start_local_worker(self):
+        """
+        启动一个本地GPT-SoVITS进程
+        :return: 新的实例，启动失败时返回None
+        """
+        if time.time() < self.next_start_time:
+            return None
+        with self.lock:
+            used_ports = {i.base_url.rsplit(':', 1)[-1] for i in self.instances}
+            port = self.local_base_port
+            while str(port) in used_ports:
+                port += 1
+            command = [part.format(port=port) for part in self.local_command]
+            os.makedirs(self.log_dir, exist_ok=True)
+            log_file = os.path.join(self.log_dir, f"gpt_sovits_{port}.log")
+            try:
+                with open(log_file, 'ab') as log:
+                    process = subprocess.Popen(command, cwd=self.local_cwd, stdout=log, stderr=subprocess.STDOUT)
+            except OSError as e:
+                print(f"无法启动本地GPT-SoVITS进程 {command}（目录: {self.local_cwd}）: {e}")
+                process = None
+            if process is not None:
+                instance = TTSInstance(f"http://127.0.0.1:{port}", process)
+                instance.log_file = log_file
+                self.instances.append(instance)
+        if process is None:
+            self.record_start_failure()
+            return None
+        return instance
+
+    def stop_local_worker(self, instance, force=False):
+        """
+        关闭本地进程
+        :param force: 为False时实例有请求则不关闭
+        :return: 是否已关闭
+        """
+        with self.lock:
+            # 选出空闲进程后可能又分配到了请求，需要在锁内重新检查
+            if instance.in_flight and not force:
+                return False
+            self.instances.remove(instance)
+        instance.process.terminate()
+        try:
+            instance.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            instance.process.kill()
+        return True
+
+    def autoscale(self):
+        """根据负载伸缩本地进程数"""
+        with self.lock:
+            local_workers = [i for i in self.instances if i.process is not None]
+            healthy = [i for i in self.instances if i.healthy]
+            load = sum(i.in_flight for i in healthy) / len(healthy) if healthy else float('inf')
+            starting = any(not i.healthy for i in local_workers)
+            idle_workers = [i for i in local_workers if i.in_flight == 0 and time.time() - i.idle_since > self.scale_down_idle]
+
+        if len(local_workers) < self.min_local_workers:
+            for _ in range(self.min_local_workers - len(local_workers)):
+                if self.start_local_worker() is None:
+                    break
+        elif load >= self.scale_up_load and len(local_workers) < self.max_local_workers and not starting:
+            # 上一个进程还在启动时不再继续扩容
+            self.start_local_worker()
+        elif len(local_workers) > self.min_local_workers and idle_workers:
+            self.stop_local_worker(idle_workers[0])
+
+    def health_check_loop(self):
+        while not self.stop_event.is_set():
+            try:
+                self.run_health_checks()
+                self.autoscale()
+            except Exception as e:
+                print(f"TTS路由器健康检查失败: {e}")
+            self.stop_event.wait(self.health_check_interval)
+
+    def collect_metrics(self):
+        """各实例的队列长度和健康状态，供 /metrics 使用"""
+        with self.lock:
+            instances = list(self.instances)
+        return [
+            ("desktopgirl_tts_queue_depth", "gauge", "GPT-SoVITS实例正在合成和排队的请求数",
+             [("desktopgirl_tts_queue_depth", [("instance", i.base_url)], i.in_flight) for i in instances]),
+            ("desktopgirl_tts_instance_up", "gauge", "GPT-SoVITS实例是否可用",
+             [("desktopgirl_tts_instance_up", [("instance", i.base_url)], int(i.healthy)) for i in instances]),
+        ]
+
+    def start(self):
+        """启动后台健康检查和伸缩"""
+        REGISTRY.add_collector(self.collect_metrics)
+        self.stop_event.clear()
+        self.health_thread = threading.Thread(target=self.health_check_loop, daemon=True)
+        self.health_thread.start()
+        return self
+
+    def stop(self):
+        """停止后台线程并关闭所有本地进程"""
+        REGISTRY.remove_collector(self.collect_metrics)
+        self.stop_event.set()
+        if self.health_thread is not None:
+            self.health_thread.join()
+        for instance in [i for i in self.instances if i.process is not None]:
+            self.stop_local_worker(instance, force=True)
+
+    def status(self):
+        """获取各实例状态"""
+        with self.lock:
+            return {
+                instance.base_url: {
+                    "状态": "可用" if instance.healthy else "不可用",
+                    "本地进程": instance.process is not None,
+                    "已加载语音": instance.loaded_voice[0] if instance.loaded_voice else "无",
+                    "请求数": instance.in_flight,
+                }
+                for instance in self.instances
+            }
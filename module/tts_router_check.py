@@ -0,0 +1,143 @@
+import sys
+import time
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from module.fake_tts_server import FakeTTSServer
+from module.tts_router import TTSRouter
+
+# 用 fake_tts_server 检查 TTS 路由器的语音亲和、故障转移、合成中的健康检查、超时和本地进程伸缩
+# 用法: python -m module.tts_router_check
+
+VOICES = [
+    {"weight-path": f"voice{i}.ckpt", "sovits-path": f"voice{i}.pth", "ref-audio-path": f"voice{i}.wav", "prompt-text": "测试"}
+    for i in range(2)
+]
+
+def wait_until(condition, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+def check_affinity():
+    """两个实例、两个语音交替请求时，每个实例只加载一次语音"""
+    servers = [FakeTTSServer(char_delay=0.005).start() for _ in range(2)]
+    router = TTSRouter([server.base_url for server in servers])
+    try:
+        for i in range(20):
+            router.synthesize("你好，这是一段测试文本。", VOICES[i % 2])
+        # 每次切换语音会调用 set_gpt_weights 和 set_sovits_weights 两个接口
+        switches = [server.switch_count for server in servers]
+        assert switches == [2, 2], f"语音亲和失效，切换次数: {switches}"
+        assert sum(server.tts_count for server in servers) == 20
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+def check_failover():
+    """一个实例停止后，请求转移到其他实例且不报错"""
+    servers = [FakeTTSServer().start() for _ in range(2)]
+    router = TTSRouter([server.base_url for server in servers], timeout=2)
+    try:
+        router.synthesize("你好", VOICES[0])
+        dead, alive = (servers[0], servers[1]) if servers[0].tts_count else (servers[1], servers[0])
+        dead.shutdown()
+        dead.server_close()
+        for _ in range(5):
+            assert router.synthesize("你好", VOICES[0])
+        assert alive.tts_count == 5, f"故障转移失败，可用实例合成次数: {alive.tts_count}"
+        status = router.status()
+        assert status[dead.base_url]["状态"] == "不可用"
+    finally:
+        servers[1].shutdown()
+        servers[1].server_close()
+
+def check_busy_instance():
+    """合成时无法响应健康检查的实例不会被标记为不可用，也不需要重新加载语音"""
+    # 每次合成约3秒，超过健康检查的2秒超时
+    server = FakeTTSServer(char_delay=0.15, blocking=True).start()
+    router = TTSRouter([server.base_url], health_check_interval=0.2).start()
+    try:
+        with ThreadPoolExecutor(2) as executor:
+            futures = [executor.submit(router.synthesize, "你好，这是一段需要合成三秒的测试文本。", VOICES[0]) for _ in range(2)]
+            for future in futures:
+                assert future.result(), "实例合成时请求失败"
+        assert router.instances[0].healthy, "合成中的实例被标记为不可用"
+        assert server.switch_count == 2, f"合成中的实例被重新加载语音，切换次数: {server.switch_count}"
+    finally:
+        router.stop()
+        server.shutdown()
+        server.server_close()
+
+def check_read_timeout():
+    """合成超时时报错，不把实例标记为不可用，也不发往其他实例重复合成"""
+    servers = [FakeTTSServer(char_delay=0.2).start() for _ in range(2)]
+    router = TTSRouter([server.base_url for server in servers], timeout=0.5)
+    try:
+        router.synthesize("你", VOICES[0])
+        try:
+            router.synthesize("你好，这是一段很长的测试文本。", VOICES[0])
+            raise AssertionError("合成超时没有报错")
+        except RuntimeError:
+            pass
+        assert all(i.healthy for i in router.instances), "合成超时的实例被标记为不可用"
+        assert sum(server.tts_count for server in servers) == 1, "超时的文本被发往其他实例重复合成"
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+def check_stop_busy_worker():
+    """选出空闲进程后又分配到请求时，不关闭该进程"""
+    router = TTSRouter([], local_command=[sys.executable, "-c", "import time; time.sleep(30)"], log_dir=tempfile.mkdtemp())
+    instance = router.start_local_worker()
+    try:
+        instance.in_flight = 1
+        assert not router.stop_local_worker(instance), "关闭了有请求的进程"
+        assert instance in router.instances and instance.process.poll() is None
+    finally:
+        router.stop()
+
+def check_scaling():
+    """负载升高时启动本地进程，空闲后关闭"""
+    server = FakeTTSServer(char_delay=0.02).start()
+    command = [sys.executable, "-m", "module.fake_tts_server", "{port}", "0.02"]
+    router = TTSRouter([server.base_url], local_command=command, min_local_workers=0, max_local_workers=1,
+                       local_base_port=19881, scale_up_load=1, scale_down_idle=1, health_check_interval=0.2,
+                       log_dir=tempfile.mkdtemp()).start()
+    try:
+        local_ready = lambda: any(i.process is not None and i.healthy for i in router.instances)
+        with ThreadPoolExecutor(6) as executor:
+            futures = [executor.submit(router.synthesize, "你好" * 10, VOICES[0]) for _ in range(30)]
+            assert wait_until(local_ready), "负载升高后没有启动本地进程"
+            for future in futures:
+                assert future.result()
+        assert wait_until(lambda: not any(i.process is not None for i in router.instances)), "空闲后本地进程没有关闭"
+    finally:
+        router.stop()
+        server.shutdown()
+        server.server_close()
+
+def check_failed_start():
+    """本地进程无法启动时不抛出异常，并推迟下一次启动"""
+    router = TTSRouter([], local_command=["这个命令不存在", "{port}"], log_dir=tempfile.mkdtemp())
+    assert router.start_local_worker() is None
+    assert router.next_start_time > time.time()
+    assert router.start_local_worker() is None and router.start_failures == 1
+
+CHECKS = [check_affinity, check_failover, check_busy_instance, check_read_timeout, check_stop_busy_worker, check_scaling, check_failed_start]
+
+if __name__ == "__main__":
+    failed = 0
+    for check in CHECKS:
+        try:
+            check()
+            print(f"✅ {check.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {check.__name__}: {e}")
+    sys.exit(1 if failed else 0)